@@ -1,2 +1,5 @@
 from bitmex_tools.bitmex_ob_service import BitmexOrderBookService
-from bitmex_tools.bitmex_ob_service import BitmexWaitForTick
\ No newline at end of file
+from bitmex_tools.bitmex_ob_service import BitmexWaitForTick
+from bitmex_tools.bitmex_feed import BitmexFeedServer
+from bitmex_tools.bitmex_feed import FastTickerClient
+from bitmex_tools.bitmex_sharded_feed import ShardedFeedRunner
@@ -0,0 +1,213 @@
+import logging
+import math
+import os
+import socket
+import stat
+import struct
+import threading
+from time import sleep
+
+from bitmex_tools.bitmex_ob_service import ENDPOINT
+from bitmex_tools.order_book_l2 import band_levels_for
+from bitmex_tools.sockets.bitmex_socket_orderbookL2 import BitMEXWebsocket as l2
+
+logger = logging.getLogger(__name__)
+
+# Every frame is: seq (uint64), depth (uint16), best bid, best ask and then, for each of the depth levels,
+# bid price, bid size, ask price, ask size (float64). Little endian. The width is fixed for a given depth
+# so a subscriber reads the header once to know how many bytes to expect per frame. Missing levels are NaN.
+HEADER = struct.Struct('<QH')
+
+
+def frame_struct(depth):
+    return struct.Struct('<QH' + 'd' * (2 + 4 * depth))
+
+
+def encode_frame(fmt, seq, depth, bbo, bids, asks):
+    values = [seq, depth, bbo[0], bbo[1]]
+    for i in range(depth):
+        values.extend(bids[i] if i < len(bids) else (math.nan, math.nan))
+        values.extend(asks[i] if i < len(asks) else (math.nan, math.nan))
+    return fmt.pack(*values)
+
+
+def decode_frame(fmt, data):
+    values = fmt.unpack(data)
+    seq, depth, best_bid, best_ask = values[0:4]
+    levels = values[4:]
+    bids = [(levels[4 * i], levels[4 * i + 1]) for i in range(depth) if not math.isnan(levels[4 * i])]
+    asks = [(levels[4 * i + 2], levels[4 * i + 3]) for i in range(depth) if not math.isnan(levels[4 * i + 2])]
+    return seq, (best_bid, best_ask), bids, asks
+
+
+def _make_socket(address):
+    # a str is a unix socket path. a (host, port) tuple is a TCP address.
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError('Feed server closed the connection.')
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class _Subscriber:
+    # Sends frames to one subscriber from its own thread. It always sends the latest frame, so a slow
+    # subscriber skips frames (and sees a gap in seq) instead of holding back everyone else.
+
+    def __init__(self, conn, on_close):
+        self.conn = conn
+        self.on_close = on_close
+        self.frame = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def push(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.condition.notify()
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    while self.frame is None:
+                        self.condition.wait()
+                    frame, self.frame = self.frame, None
+                self.conn.sendall(frame)
+        except OSError:  # gone or stuck for SEND_TIMEOUT. a partial frame cannot be recovered so we drop it.
+            pass
+        finally:
+            self.conn.close()
+            self.on_close(self)
+
+
+class BitmexFeedServer:
+    # Subscribers that cannot take a frame within this delay are dropped. They will reconnect.
+    SEND_TIMEOUT = 5
+
+    def __init__(self, symbol, address, depth=5, band=None, band_levels=None):
+        self.symbol = symbol
+        self.address = address
+        self.depth = depth
+        self.band_levels = band_levels_for(depth, band, band_levels)
+        self.fmt = frame_struct(depth)
+        self.seq = 0
+        self.last_frame = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+        self.server = _make_socket(address)
+        if isinstance(address, str):
+            if os.path.exists(address):
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    raise ValueError(f'{address} already exists and is not a socket.')
+                os.remove(address)
+        else:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen()
+        logger.info(f'Feed server for {symbol} listening on {address}.')
+
+        self.socket = l2(endpoint=ENDPOINT, symbol=symbol, band=band, band_levels=self.band_levels)
+        self.accept_thread = threading.Thread(target=self.accept)
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+    def accept(self):
+        while True:
+            conn, _ = self.server.accept()
+            conn.settimeout(self.SEND_TIMEOUT)
+            subscriber = _Subscriber(conn, self.remove)
+            with self.lock:
+                if self.last_frame is not None:
+                    subscriber.push(self.last_frame)
+                self.subscribers.append(subscriber)
+            logger.info(f'New subscriber. Total: {len(self.subscribers)}.')
+
+    def remove(self, subscriber):
+        with self.lock:
+            self.subscribers.remove(subscriber)
+        logger.info(f'Dropped subscriber. Total: {len(self.subscribers)}.')
+
+    def publish(self, bbo, bids, asks):
+        self.seq += 1
+        frame = encode_frame(self.fmt, self.seq, self.depth, bbo, bids, asks)
+        with self.lock:
+            self.last_frame = frame
+            for subscriber in self.subscribers:
+                subscriber.push(frame)
+
+    def run(self):
+        order_book_l2 = self.socket.order_book_l2
+        last = None
+        book_seq = None
+        while True:
+            if order_book_l2.seq != book_seq:
+                book_seq, bbo, bids, asks = order_book_l2.top_of_book(self.depth)
+                if bbo is not None and (bbo, bids, asks) != last:
+                    last = (bbo, bids, asks)
+                    self.publish(bbo, bids, asks)
+            sleep(0.0001)
+
+
+class FastTickerClient:
+    # Same API as FastTickerBitmex but reads from a BitmexFeedServer instead of opening a BitMEX connection.
+
+    def __init__(self, address):
+        self.address = address
+        self.gaps = 0
+        self.frame = None  # (seq, bbo, bids, asks) of the last frame, replaced as a whole.
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        while self.bbo() is None:
+            sleep(0.001)
+
+    def read(self):
+        # (seq, bbo, bids, asks) all from the same frame. Use it rather than bbo() then top() for a consistent view.
+        return self.frame
+
+    def bbo(self):
+        frame = self.frame
+        return None if frame is None else frame[1]
+
+    def top(self):
+        frame = self.frame
+        return None if frame is None else (frame[2], frame[3])
+
+    @property
+    def seq(self):
+        frame = self.frame
+        return None if frame is None else frame[0]
+
+    def run(self):
+        while True:
+            try:
+                sock = _make_socket(self.address)
+                sock.connect(self.address)
+                seq = None  # no gap check on the first frame after a (re)connect.
+                while True:
+                    header = _recv_exactly(sock, HEADER.size)
+                    fmt = frame_struct(HEADER.unpack(header)[1])
+                    new_seq, bbo, bids, asks = decode_frame(fmt, header + _recv_exactly(sock, fmt.size - HEADER.size))
+                    if seq is not None and new_seq != seq + 1:
+                        self.gaps += 1
+                        logger.warning(f'Gap in the feed: {seq} -> {new_seq}.')
+                    seq = new_seq
+                    self.frame = seq, bbo, bids, asks
+            except OSError:
+                logger.exception('Lost connection to the feed server.')
+                sock.close()
+                sleep(1)
+                logger.info('Trying to reconnect to the feed server...')
@@ -5,6 +5,7 @@ from time import sleep, time
 import numpy as np
 import pandas as pd
 
+from bitmex_tools.depth_ladder import DepthLadder
 from bitmex_tools.sockets.bitmex_socket_orderbook10 import BitMEXWebsocket as ob10
 from bitmex_tools.sockets.bitmex_socket_orderbookL2 import BitMEXWebsocket as l2
 
@@ -15,8 +16,8 @@ ENDPOINT = 'wss://www.bitmex.com/realtime'
 
 class FastTickerBitmex:
 
-    def __init__(self, symbol):
-        self.socket = l2(endpoint=ENDPOINT, symbol=symbol)
+    def __init__(self, symbol, band=None, band_levels=None):
+        self.socket = l2(endpoint=ENDPOINT, symbol=symbol, band=band, band_levels=band_levels)
         while self.bbo() is None:
             sleep(0.001)
 
@@ -80,6 +81,11 @@ class BitmexOrderBookService:
         assert 0 <= depth - 1 < len(self.cumsum_bid_volumes)
         return np.log(self.cumsum_bid_volumes[depth - 1]) - np.log(self.cumsum_ask_volumes[depth - 1])
 
+    def get_ladder(self, side):
+        # DepthLadder of the top depth bids (side='Buy') or asks (side='Sell'). Queries past them return NaN.
+        levels = self.b if side == 'Buy' else self.a
+        return DepthLadder(levels[:, 0], levels[:, 1], side)
+
     def get_ob(self):
         bids = np.transpose(np.vstack([self.b[:, 0], self.cumsum_bid_volumes]))
         asks = np.transpose(np.flip(np.vstack([self.a[:, 0], self.cumsum_ask_volumes]), axis=-1))
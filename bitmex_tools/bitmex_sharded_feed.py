@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import struct
+import threading
+from time import sleep, time
+
+from bitmex_tools.bitmex_feed import decode_frame, encode_frame, frame_struct
+from bitmex_tools.bitmex_ob_service import ENDPOINT
+from bitmex_tools.order_book_l2 import band_levels_for
+from bitmex_tools.sockets.bitmex_socket_orderbookL2 import BitMEXWebsocket as l2
+
+logger = logging.getLogger(__name__)
+
+# Each symbol owns one slot of shared memory holding a bitmex_feed frame. The frame seq doubles as a seqlock:
+# the worker makes it odd while it writes the slot and even once the slot is consistent again.
+SEQ = struct.Struct('<Q')
+
+
+def _run_shard(symbols, slots, buffer, depth, band, band_levels):
+    fmt = frame_struct(depth)
+    view = memoryview(buffer).cast('B')
+    sockets = [l2(endpoint=ENDPOINT, symbol=symbol, band=band, band_levels=band_levels) for symbol in symbols]
+    # carry on from the seq left by the previous worker of this shard, if any.
+    seqs = [(SEQ.unpack_from(view, slot * fmt.size)[0] + 1) // 2 for slot in slots]
+    book_seqs = [None] * len(symbols)
+    last = [None] * len(symbols)
+    while True:
+        for i, socket in enumerate(sockets):
+            order_book_l2 = socket.order_book_l2
+            if order_book_l2.seq == book_seqs[i]:  # nothing new. cheap enough to leave the GIL to the sockets.
+                continue
+            book_seqs[i], bbo, bids, asks = order_book_l2.top_of_book(depth)
+            if bbo is None or (bbo, bids, asks) == last[i]:
+                continue
+            last[i] = bbo, bids, asks
+            seqs[i] += 1
+            offset = slots[i] * fmt.size
+            frame = encode_frame(fmt, 2 * seqs[i], depth, bbo, bids, asks)
+            SEQ.pack_into(view, offset, 2 * seqs[i] - 1)
+            view[offset + SEQ.size:offset + fmt.size] = frame[SEQ.size:]
+            SEQ.pack_into(view, offset, 2 * seqs[i])
+        sleep(0.0001)
+
+
+class ShardedFeedRunner:
+    # a dead worker is restarted after a delay doubling from MIN_BACKOFF up to MAX_BACKOFF seconds.
+    # The delay goes back to MIN_BACKOFF once a worker stayed up for STABLE_SECONDS.
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 300
+    STABLE_SECONDS = 60
+
+    def __init__(self, symbols, num_workers=None, depth=5, band=None, band_levels=None):
+        self.symbols = list(symbols)
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self.num_workers = min(num_workers, len(self.symbols))
+        # spawn: the parent may already run websocket threads, which do not survive a fork.
+        self.context = multiprocessing.get_context('spawn')
+        self.depth = depth
+        self.band = band
+        self.band_levels = band_levels_for(depth, band, band_levels)
+        self.fmt = frame_struct(depth)
+        self.slots = {symbol: slot for slot, symbol in enumerate(self.symbols)}
+        self.buffer = self.context.RawArray('B', len(self.symbols) * self.fmt.size)
+        self.view = memoryview(self.buffer).cast('B')
+        self.shards = [self.symbols[i::self.num_workers] for i in range(self.num_workers)]
+        self.shard_of = {symbol: i for i, shard in enumerate(self.shards) for symbol in shard}
+        # symbol -> slot seq when its worker died. Frames up to it are stale until the new worker writes again.
+        self.stale_seqs = {}
+        self.workers = [None] * self.num_workers
+        self.started_at = [None] * self.num_workers
+        self.backoffs = [self.MIN_BACKOFF] * self.num_workers
+        self.retry_at = [None] * self.num_workers
+        self.restarts = 0
+        for i in range(self.num_workers):
+            self.start_worker(i)
+        self.thread = threading.Thread(target=self.monitor)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def start_worker(self, i):
+        symbols = self.shards[i]
+        slots = [self.slots[symbol] for symbol in symbols]
+        args = (symbols, slots, self.buffer, self.depth, self.band, self.band_levels)
+        worker = self.context.Process(target=_run_shard, args=args, name=f'shard-{i}')
+        worker.daemon = True
+        worker.start()
+        self.workers[i] = worker
+        self.started_at[i] = time()
+        logger.info(f'Started worker {worker.name} (pid={worker.pid}) for {symbols}.')
+
+    def monitor(self):
+        while True:
+            for i, worker in enumerate(self.workers):
+                if worker.is_alive():
+                    continue
+                if self.retry_at[i] is None:
+                    for symbol in self.shards[i]:
+                        self.stale_seqs[symbol] = SEQ.unpack_from(self.view, self.slots[symbol] * self.fmt.size)[0]
+                    if time() - self.started_at[i] > self.STABLE_SECONDS:
+                        self.backoffs[i] = self.MIN_BACKOFF
+                    self.retry_at[i] = time() + self.backoffs[i]
+                    logger.warning(f'Worker {worker.name} died (exit code={worker.exitcode}). '
+                                   f'Restarting in {self.backoffs[i]}s...')
+                    self.backoffs[i] = min(2 * self.backoffs[i], self.MAX_BACKOFF)
+                elif time() >= self.retry_at[i]:
+                    self.retry_at[i] = None
+                    self.restarts += 1
+                    self.start_worker(i)
+            sleep(0.1)
+
+    def read(self, symbol):
+        # (seq, bbo, bids, asks) for symbol. None until its first update, and from the moment its worker dies
+        # until the restarted worker publishes again: a dead worker's last frame is never served as current.
+        offset = self.slots[symbol] * self.fmt.size
+        stale_seq = self.stale_seqs.get(symbol, 0)
+        for i in range(1000):
+            seq = SEQ.unpack_from(self.view, offset)[0]
+            if seq <= stale_seq:
+                return None
+            if seq % 2 == 0:
+                data = bytes(self.view[offset:offset + self.fmt.size])
+                if SEQ.unpack_from(self.view, offset)[0] == seq:
+                    seq, bbo, bids, asks = decode_frame(self.fmt, data)
+                    return seq // 2, bbo, bids, asks
+            elif not self.workers[self.shard_of[symbol]].is_alive():
+                return None  # the worker died while writing this slot.
+            sleep(0)  # the worker is writing this slot.
+        return None
+
+    def alive(self, symbol):
+        return self.read(symbol) is not None
+
+    def bbo(self, symbol):
+        frame = self.read(symbol)
+        return None if frame is None else frame[1]
+
+    def top(self, symbol):
+        frame = self.read(symbol)
+        return None if frame is None else (frame[2], frame[3])
+
+    def snapshot(self):
+        return {symbol: self.read(symbol) for symbol in self.symbols}
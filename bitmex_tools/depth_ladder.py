@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class DepthLadder:
+    # One side of the book, best level first, with prefix sums of sizes and notionals.
+    # Every query takes a scalar or a whole array and is answered with np.searchsorted (no Python loop).
+
+    def __init__(self, prices, sizes, side):
+        self.side = side
+        self.prices = np.asarray(prices, dtype=float)
+        self.sizes = np.asarray(sizes, dtype=float)
+        # bids are sorted by decreasing price. Flipping their sign gives increasing distances from the touch.
+        self.keys = -self.prices if side == 'Buy' else self.prices
+        # a leading 0 so that cum_sizes[i] is the size of the first i levels. NaN price past the last level.
+        self.cum_sizes = np.concatenate([[0.0], np.cumsum(self.sizes)])
+        self.cum_notionals = np.concatenate([[0.0], np.cumsum(self.prices * self.sizes)])
+        self.level_prices = np.append(self.prices, np.nan)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def price_at_size(self, sizes):
+        # price of the level where the cumulative size reaches sizes. NaN if the book is not deep enough.
+        idx = np.searchsorted(self.cum_sizes[1:], np.asarray(sizes, dtype=float), side='left')
+        return self.level_prices[idx]
+
+    def avg_price(self, sizes):
+        # average price paid (or received) to take sizes out of this side. NaN if the book is not deep enough.
+        sizes = np.asarray(sizes, dtype=float)
+        idx = np.searchsorted(self.cum_sizes[1:], sizes, side='left')
+        notionals = self.cum_notionals[idx] + (sizes - self.cum_sizes[idx]) * self.level_prices[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # a size of 0 fills at the touch, like price_at_size(0).
+            return np.where(sizes == 0, self.level_prices[idx], notionals / sizes)[()]
+
+    def size_within(self, offsets, reference):
+        # total size resting at most offsets away from reference (usually the mid price).
+        reference = -reference if self.side == 'Buy' else reference
+        idx = np.searchsorted(self.keys, reference + np.asarray(offsets, dtype=float), side='right')
+        return self.cum_sizes[idx]
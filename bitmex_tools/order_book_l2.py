@@ -1,24 +1,84 @@
+import heapq
 import logging
+import threading
+from collections import deque
+from itertools import islice
 from time import time, sleep
 
+import numpy as np
 from sortedcontainers import SortedDict
 
+from bitmex_tools.depth_ladder import DepthLadder
+
 logger = logging.getLogger(__name__)
 
+# default minimum number of levels per side kept in the sorted books in banded mode (band_levels=None).
+BAND_LEVELS = 25
+
+
+def band_levels_for(depth, band, band_levels=None):
+    # band_levels to use for a consumer reading top(depth). Only checked in banded mode, where top(depth) is
+    # only exact for depth <= band_levels. None picks max(depth, BAND_LEVELS).
+    if band is None:
+        return band_levels
+    if band_levels is None:
+        return max(depth, BAND_LEVELS)
+    if depth > band_levels:
+        raise ValueError(f'depth={depth} requires band_levels >= {depth}, got {band_levels}.')
+    return band_levels
+
 
 class OrderBookL2:
 
-    def __init__(self):
+    def __init__(self, max_changes=10000, band=None, band_levels=None):
         self.bid_order_book = SortedDict()
         self.ask_order_book = SortedDict()
         self.ups = NumUpdatesPerSeconds()
+        # incremented on every message. changes holds (seq, side, price, size) for the most recent level
+        # changes, size 0 meaning the level was deleted. Callers behind changes_floor get a full snapshot.
+        self.seq = 0
+        self.changes = deque()
+        self.max_changes = max_changes
+        self.changes_floor = 0
+        self.lock = threading.Lock()
+        self.ladders = {}  # (side, depth) -> (seq, DepthLadder).
+        # banded mode: only the levels priced within band (e.g. 0.02 for 2%) of the mid, and at least band_levels
+        # levels per side, are kept in the sorted books. The others sit in far_levels (id -> (side, size, price)).
+        # Every far level is worse than every level of the sorted book of its side, so bbo() is exact and so is
+        # top(depth) for depth <= band_levels. ladder() and changes_since() only see the sorted books: past the
+        # kept levels, a ladder returns NaN (or undercounts in size_within) even though far levels rest there.
+        self.band = band
+        self.band_levels = BAND_LEVELS if band_levels is None else band_levels
+        self.band_center = None
+        self.band_low = float('-inf')
+        self.band_high = float('inf')
+        self.far_levels = {}
+        self.far_counts = {'Buy': 0, 'Sell': 0}
 
     def fetch_queue(self, row):
         return self.bid_order_book if row['side'] == 'Buy' else self.ask_order_book
 
     def insert(self, row):
+        price = float(row['price'])
+        if self.band is not None and not self.within_band(row['side'], price):
+            self.far_levels[row['id']] = (row['side'], row['size'], price)
+            self.far_counts[row['side']] += 1
+            return
         book = self.fetch_queue(row)
-        book[row['id']] = (row['size'], float(row['price']))
+        book[row['id']] = (row['size'], price)
+        self.record(row['side'], price, row['size'])
+
+    def within_band(self, side, price):
+        if side == 'Buy':
+            book = self.bid_order_book
+            return price >= self.band_low or (len(book) > 0 and price >= book.peekitem(-1)[1][1])
+        book = self.ask_order_book
+        return price <= self.band_high or (len(book) > 0 and price <= book.peekitem(0)[1][1])
+
+    def record(self, side, price, size):
+        if len(self.changes) == self.max_changes:
+            self.changes_floor = self.changes.popleft()[0]
+        self.changes.append((self.seq, side, price, size))
 
     def __str__(self):
         a = list(self.ask_order_book.values())
@@ -26,14 +86,7 @@ class OrderBookL2:
         return f'{a}\n{b}\n{self.best_ask}\n{self.best_bid}\n--\n'
 
     def bbo(self):
-        best_bid = self.best_bid
-        best_ask = self.best_ask
-        if best_bid is None or best_ask is None:
-            return None
-        if best_ask <= best_bid:
-            best_ask = best_bid + 0.5
-        # assert best_bid <= best_ask
-        return best_bid, best_ask
+        return _bbo(self.best_bid, self.best_ask)
 
     @property
     def best_bid(self):
@@ -53,31 +106,192 @@ class OrderBookL2:
                 sleep(0.001)
         return None
 
+    def best_asks(self, depth):
+        # the asks are stored by increasing id, i.e. decreasing price. Walking the tail by index keeps this
+        # O(depth) where reversed(values()) looks up every level one index at a time.
+        book = self.ask_order_book
+        return (book[row_id] for row_id in book.islice(max(len(book) - depth, 0), reverse=True))
+
+    def top(self, depth=5):
+        # best levels first. returns ([(price, size), ...], [(price, size), ...]) for the bids and the asks.
+        for i in range(100):
+            try:
+                bids = [(price, size) for size, price in islice(self.bid_order_book.values(), depth)]
+                asks = [(price, size) for size, price in self.best_asks(depth)]
+                return bids, asks
+            except (IndexError, KeyError, RuntimeError):  # book modified by the socket thread.
+                sleep(0.001)
+        return None
+
+    def top_of_book(self, depth=5):
+        # (seq, bbo, bids, asks) read in one go under the lock so that the bbo always agrees with the levels.
+        with self.lock:
+            bids = [(price, size) for size, price in islice(self.bid_order_book.values(), depth)]
+            asks = [(price, size) for size, price in self.best_asks(depth)]
+            seq = self.seq
+        bbo = _bbo(bids[0][0] if bids else None, asks[0][0] if asks else None)
+        return seq, bbo, bids, asks
+
+    def ladder(self, side, depth=200):
+        # DepthLadder of the best depth bids (side='Buy') or asks (side='Sell'). Queries past these levels
+        # return NaN. Rebuilt at most once per seq, from a copy of the top levels taken outside of message().
+        # In banded mode, only the kept levels are included (at least band_levels per side): far levels are not.
+        cached = self.ladders.get((side, depth))
+        if cached is not None and cached[0] == self.seq:
+            return cached[1]
+        with self.lock:
+            seq = self.seq
+            if side == 'Buy':
+                levels = list(islice(self.bid_order_book.values(), depth))
+            else:
+                levels = list(self.best_asks(depth))
+        levels = _levels(levels)  # [size, price] rows.
+        ladder = DepthLadder(levels[:, 1], levels[:, 0], side)
+        self.ladders[(side, depth)] = seq, ladder
+        return ladder
+
     def update(self, row):
-        book = self.fetch_queue(row)
         row_id = row['id']
+        if row_id in self.far_levels:
+            side, size, price = self.far_levels[row_id]
+            self.far_levels[row_id] = (side, row['size'], price)
+            return
+        book = self.fetch_queue(row)
         size, price = book[row_id]
         book[row_id] = (row['size'], price)
+        self.record(row['side'], price, row['size'])
 
     def delete(self, row):
+        if row['id'] in self.far_levels:
+            side, size, price = self.far_levels.pop(row['id'])
+            self.far_counts[side] -= 1
+            return
         book = self.fetch_queue(row)
         check1 = len(book)
-        del book[row['id']]
+        size, price = book.pop(row['id'])
         assert len(book) + 1 == check1
+        self.record(row['side'], price, 0)
 
     def message(self, message):
         self.ups.count()
         action = message['action']
         data = message['data']
-        for row in data:
-            if action in ['partial', 'insert']:
-                self.insert(row)
-            elif action == 'update':
-                self.update(row)
-            elif action == 'delete':
-                self.delete(row)
-            else:
-                raise Exception('Unknown action.')
+        with self.lock:
+            self.seq += 1
+            if action == 'partial':  # (re)subscription. The partial is the whole book: drop everything from before.
+                self.reset()
+                self.changes_floor = self.seq
+            for row in data:
+                if action in ['partial', 'insert']:
+                    self.insert(row)
+                elif action == 'update':
+                    self.update(row)
+                elif action == 'delete':
+                    self.delete(row)
+                else:
+                    raise Exception('Unknown action.')
+            if self.band is not None:
+                self.rebalance()
+
+    def rebalance(self):
+        # re-center the band once the mid drifted by a quarter of it. Otherwise only top up thin sides.
+        bids, asks = self.bid_order_book, self.ask_order_book
+        if self.band_center is None:
+            if bids or asks:
+                self.reband()
+            return
+        if bids and asks:
+            mid = 0.5 * bids.peekitem(0)[1][1] + 0.5 * asks.peekitem(-1)[1][1]
+            if abs(mid - self.band_center) > 0.25 * self.band * self.band_center:
+                self.reband()
+                return
+        for side, book in [('Buy', bids), ('Sell', asks)]:
+            if len(book) < self.band_levels and self.far_counts[side]:
+                self.promote(side, 2 * self.band_levels - len(book))
+
+    def reband(self):
+        bids, asks = self.bid_order_book, self.ask_order_book
+        if not bids and self.far_counts['Buy']:
+            self.promote('Buy', 1)
+        if not asks and self.far_counts['Sell']:
+            self.promote('Sell', 1)
+        touch = [book.peekitem(i)[1][1] for book, i in [(bids, 0), (asks, -1)] if book]
+        if not touch:
+            return
+        self.band_center = sum(touch) / len(touch)
+        self.band_low = self.band_center * (1 - self.band)
+        self.band_high = self.band_center * (1 + self.band)
+        # demotions and promotions are recorded as deletes and inserts so changes_since() mirrors the band.
+        for side, book in [('Buy', bids), ('Sell', asks)]:
+            for row_id, (size, price) in list(book.items()):
+                if (side == 'Buy' and price < self.band_low) or (side != 'Buy' and price > self.band_high):
+                    del book[row_id]
+                    self.record(side, price, 0)
+                    self.far_levels[row_id] = (side, size, price)
+                    self.far_counts[side] += 1
+        for row_id, (side, size, price) in list(self.far_levels.items()):
+            if (side == 'Buy' and price >= self.band_low) or (side != 'Buy' and price <= self.band_high):
+                self.promote_level(row_id)
+        for side, book in [('Buy', bids), ('Sell', asks)]:
+            if len(book) < self.band_levels and self.far_counts[side]:
+                self.promote(side, 2 * self.band_levels - len(book))
+
+    def promote(self, side, n):
+        # move the n best far levels of side to the sorted book. O(far levels), so only done on thin sides.
+        levels = [(price, row_id) for row_id, (far_side, size, price) in self.far_levels.items() if far_side == side]
+        best = heapq.nlargest(n, levels) if side == 'Buy' else heapq.nsmallest(n, levels)
+        for price, row_id in best:
+            self.promote_level(row_id)
+
+    def promote_level(self, row_id):
+        side, size, price = self.far_levels.pop(row_id)
+        self.far_counts[side] -= 1
+        book = self.bid_order_book if side == 'Buy' else self.ask_order_book
+        book[row_id] = (size, price)
+        self.record(side, price, size)
+
+    def reset(self):
+        self.bid_order_book.clear()
+        self.ask_order_book.clear()
+        self.changes.clear()
+        self.far_levels.clear()
+        self.far_counts = {'Buy': 0, 'Sell': 0}
+        self.band_center = None
+        self.band_low = float('-inf')
+        self.band_high = float('inf')
+
+    def changes_since(self, seq):
+        """
+        Levels inserted, updated or deleted after seq. Returns (seq, snapshot, bids, asks) where bids and asks
+        are (n, 2) arrays of [price, size] in no particular order, size 0 meaning the level was deleted.
+        If seq is older than the retained history, snapshot is True and bids and asks are the full book.
+        """
+        with self.lock:
+            if seq < self.changes_floor or seq > self.seq:
+                bids = [(price, size) for size, price in self.bid_order_book.values()]
+                asks = [(price, size) for size, price in self.ask_order_book.values()]
+                return self.seq, True, _levels(bids), _levels(asks)
+            latest = {}
+            for change_seq, side, price, size in reversed(self.changes):
+                if change_seq <= seq:
+                    break
+                latest.setdefault((side, price), size)
+            bids = [(price, size) for (side, price), size in latest.items() if side == 'Buy']
+            asks = [(price, size) for (side, price), size in latest.items() if side != 'Buy']
+            return self.seq, False, _levels(bids), _levels(asks)
+
+
+def _bbo(best_bid, best_ask):
+    if best_bid is None or best_ask is None:
+        return None
+    if best_ask <= best_bid:
+        best_ask = best_bid + 0.5
+    # assert best_bid <= best_ask
+    return best_bid, best_ask
+
+
+def _levels(rows):
+    return np.array(rows, dtype=float).reshape(-1, 2)
 
 
 class NumUpdatesPerSeconds:
@@ -17,7 +17,7 @@ class BitMEXWebsocket:
     # Don't grow a table larger than this amount. Helps cap memory usage.
     MAX_TABLE_LEN = 200
 
-    def __init__(self, endpoint, symbol, api_key=None, api_secret=None):
+    def __init__(self, endpoint, symbol, api_key=None, api_secret=None, band=None, band_levels=None):
         """Connect to the websocket and initialize data stores."""
         logger.debug('Initializing WebSocket.')
 
@@ -36,7 +36,7 @@ class BitMEXWebsocket:
         self.keys = {}
         self.exited = False
 
-        self.order_book_l2 = OrderBookL2()
+        self.order_book_l2 = OrderBookL2(band=band, band_levels=band_levels)
 
         # We can subscribe right in the connection querystring, so let's build that.
         # Subscribe to all pertinent endpoints
@@ -0,0 +1,19 @@
+from time import sleep
+
+from bitmex_tools.bitmex_feed import FastTickerClient
+
+
+def main():
+    # start examples/feed_server.py first.
+    ftc = FastTickerClient('/tmp/bitmex_XBTUSD.sock')
+    last_bbo = None
+    while True:
+        seq, new_bbo, bids, asks = ftc.read()
+        if new_bbo != last_bbo:
+            last_bbo = new_bbo
+            print(seq, new_bbo, bids, asks)
+        sleep(0.0001)
+
+
+if __name__ == '__main__':
+    main()
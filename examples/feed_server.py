@@ -0,0 +1,15 @@
+import logging
+
+from bitmex_tools.bitmex_feed import BitmexFeedServer
+
+
+def main():
+    # one BitMEX connection, served to every local subscriber.
+    server = BitmexFeedServer('XBTUSD', address='/tmp/bitmex_XBTUSD.sock', depth=5)
+    server.run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)12s - %(threadName)12s - %(name)18s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,26 @@
+from time import sleep
+
+import numpy as np
+
+from bitmex_tools.bitmex_ob_service import FastTickerBitmex
+
+
+def main():
+    ftb = FastTickerBitmex('XBTUSD')
+    order_book_l2 = ftb.socket.order_book_l2
+    clip_sizes = np.arange(1, 101) * 10000
+    while True:
+        # buying walks the asks.
+        asks = order_book_l2.ladder('Sell')
+        avg_prices = asks.avg_price(clip_sizes)
+        best_bid, best_ask = ftb.bbo()
+        mid = 0.5 * best_bid + 0.5 * best_ask
+        print(f'MID: {mid}| '
+              f'BUY {int(clip_sizes[-1]):,} AT: {avg_prices[-1]:.2f}| '
+              f'LAST LEVEL: {asks.price_at_size(clip_sizes[-1])}| '
+              f'ASK SIZE WITHIN 10 OF MID: {int(asks.size_within(10, mid)):,}')
+        sleep(1)
+
+
+if __name__ == '__main__':
+    main()
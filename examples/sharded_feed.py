@@ -0,0 +1,22 @@
+import logging
+from time import sleep
+
+from bitmex_tools.bitmex_sharded_feed import ShardedFeedRunner
+
+
+def main():
+    runner = ShardedFeedRunner(['XBTUSD', 'ETHUSD', 'XRPUSD', 'LTCUSD'], num_workers=2, depth=5)
+    while True:
+        for symbol, frame in runner.snapshot().items():
+            if frame is not None:
+                seq, bbo, bids, asks = frame
+                print(f'{symbol}| SEQ: {seq}| BBO: {bbo}| BID VOLUME: {sum(size for _, size in bids):,.0f}| '
+                      f'ASK VOLUME: {sum(size for _, size in asks):,.0f}')
+        print(f'RESTARTS: {runner.restarts}')
+        sleep(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)12s - %(threadName)12s - %(name)18s - %(levelname)s - %(message)s')
+    main()
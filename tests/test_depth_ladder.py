@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from bitmex_tools.depth_ladder import DepthLadder
+
+
+@pytest.fixture
+def asks():
+    return DepthLadder([10.0, 11.0, 12.0], [1.0, 2.0, 3.0], 'Sell')
+
+
+@pytest.fixture
+def bids():
+    return DepthLadder([9.0, 8.0, 7.0], [1.0, 2.0, 3.0], 'Buy')
+
+
+def test_avg_price_asks(asks):
+    expected = [10.0, 10.0, 10.5, 32.0 / 3.0, 68.0 / 6.0, np.nan]
+    np.testing.assert_allclose(asks.avg_price([0, 1, 2, 3, 6, 7]), expected)
+
+
+def test_avg_price_bids(bids):
+    expected = [9.0, 9.0, 8.5, 25.0 / 3.0, 46.0 / 6.0, np.nan]
+    np.testing.assert_allclose(bids.avg_price([0, 1, 2, 3, 6, 7]), expected)
+
+
+def test_avg_price_scalar(asks):
+    assert asks.avg_price(2) == 10.5
+    assert np.ndim(asks.avg_price(2)) == 0
+
+
+def test_price_at_size(asks, bids):
+    np.testing.assert_array_equal(asks.price_at_size([0, 1, 1.5, 3, 3.5, 6, 7]),
+                                  [10.0, 10.0, 11.0, 11.0, 12.0, 12.0, np.nan])
+    np.testing.assert_array_equal(bids.price_at_size([0, 1, 1.5, 3, 3.5, 6, 7]),
+                                  [9.0, 9.0, 8.0, 8.0, 7.0, 7.0, np.nan])
+
+
+def test_size_within(asks, bids):
+    mid = 9.5
+    np.testing.assert_array_equal(asks.size_within([0, 0.5, 1.4, 1.5, 2.5, 100], mid), [0, 1, 1, 3, 6, 6])
+    np.testing.assert_array_equal(bids.size_within([0, 0.5, 1.4, 1.5, 2.5, 100], mid), [0, 1, 1, 3, 6, 6])
+
+
+def test_empty_ladder():
+    ladder = DepthLadder([], [], 'Sell')
+    assert len(ladder) == 0
+    assert np.isnan(ladder.avg_price(1))
+    assert np.isnan(ladder.price_at_size(1))
+    assert ladder.size_within(1, 10.0) == 0
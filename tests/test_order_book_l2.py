@@ -0,0 +1,140 @@
+import random
+
+import pytest
+
+from bitmex_tools.order_book_l2 import BAND_LEVELS, OrderBookL2, band_levels_for
+
+# BitMEX style ids: the price is a function of the id (here price = ID_BASE - id, one tick = 1).
+ID_BASE = 100000
+
+
+def row(row_id, side, size=None):
+    row = {'id': row_id, 'side': side, 'price': ID_BASE - row_id}
+    if size is not None:
+        row['size'] = size
+    return row
+
+
+def random_walk(seed, steps, mid=50000):
+    # yields BitMEX messages for a market drifting away from mid and back, with sparse levels near the touch.
+    rng = random.Random(seed)
+    live = {}
+    data = []
+    for price in range(mid - 5000, mid + 5000, 5):
+        side = 'Buy' if price < mid else 'Sell'
+        live[ID_BASE - price] = side
+        data.append(row(ID_BASE - price, side, 10))
+    yield {'action': 'partial', 'data': data}
+    for step in range(steps):
+        mid += 5 * (rng.choice([-1, 0, 1, 2, 3]) if step < steps // 2 else rng.choice([-3, -2, -1, 0, 1]))
+        crossed = [row_id for row_id, side in live.items()
+                   if (side == 'Buy' and ID_BASE - row_id >= mid) or (side == 'Sell' and ID_BASE - row_id <= mid)]
+        if crossed:
+            yield {'action': 'delete', 'data': [row(row_id, live.pop(row_id)) for row_id in crossed]}
+        price = mid + rng.choice([-1, 1]) * 5 * rng.randint(1, 200)
+        row_id = ID_BASE - price
+        if row_id in live:
+            if rng.random() < 0.5:
+                yield {'action': 'delete', 'data': [row(row_id, live.pop(row_id))]}
+            else:
+                yield {'action': 'update', 'data': [row(row_id, live[row_id], rng.randint(1, 50))]}
+        else:
+            live[row_id] = 'Buy' if price < mid else 'Sell'
+            yield {'action': 'insert', 'data': [row(row_id, live[row_id], rng.randint(1, 50))]}
+
+
+def apply_changes(mirror, bids, asks):
+    for side, levels in [('Buy', bids), ('Sell', asks)]:
+        for price, size in levels:
+            if size == 0:
+                mirror.pop((side, price), None)
+            else:
+                mirror[(side, price)] = size
+
+
+def kept_levels(order_book_l2):
+    levels = {('Buy', price): size for size, price in order_book_l2.bid_order_book.values()}
+    levels.update({('Sell', price): size for size, price in order_book_l2.ask_order_book.values()})
+    return levels
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_banded_book_matches_full_book(seed):
+    full = OrderBookL2()
+    banded = OrderBookL2(band=0.003, band_levels=10)
+    mirror = {}
+    seq = -1
+    for step, message in enumerate(random_walk(seed, steps=3000)):
+        full.message(message)
+        banded.message(message)
+        assert banded.bbo() == full.bbo()
+        assert banded.top(banded.band_levels) == full.top(banded.band_levels)
+        if step % 50 == 0:
+            seq, snapshot, bids, asks = banded.changes_since(seq)
+            if snapshot:
+                mirror = {}
+            apply_changes(mirror, bids, asks)
+            assert mirror == kept_levels(banded)
+    # the band kept only a fraction of the book.
+    assert len(banded.far_levels) > 10 * (len(banded.bid_order_book) + len(banded.ask_order_book))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_far_levels_are_worse_than_kept_levels(seed):
+    banded = OrderBookL2(band=0.003, band_levels=10)
+    for step, message in enumerate(random_walk(seed, steps=2000)):
+        banded.message(message)
+        if step % 100 == 0:
+            worst_bid = banded.bid_order_book.peekitem(-1)[1][1]
+            worst_ask = banded.ask_order_book.peekitem(0)[1][1]
+            for side, size, price in banded.far_levels.values():
+                assert price < worst_bid if side == 'Buy' else price > worst_ask
+            assert banded.far_counts['Buy'] == sum(side == 'Buy' for side, _, _ in banded.far_levels.values())
+            assert banded.far_counts['Sell'] == sum(side == 'Sell' for side, _, _ in banded.far_levels.values())
+
+
+def test_reband_promotes_far_levels():
+    banded = OrderBookL2(band=0.01, band_levels=1)
+    banded.message({'action': 'partial', 'data': [row(ID_BASE - 990, 'Buy', 1), row(ID_BASE - 1010, 'Sell', 1),
+                                                   row(ID_BASE - 1050, 'Sell', 7)]})
+    far_id = ID_BASE - 1050
+    assert far_id in banded.far_levels
+    seq = banded.seq
+    # the far ask is updated while out of the band, then the market moves up to it.
+    banded.message({'action': 'update', 'data': [row(far_id, 'Sell', 3)]})
+    banded.message({'action': 'delete', 'data': [row(ID_BASE - 1010, 'Sell')]})
+    banded.message({'action': 'insert', 'data': [row(ID_BASE - 1040, 'Buy', 2)]})
+    assert far_id not in banded.far_levels
+    assert banded.bbo() == (1040.0, 1050.0)
+    assert banded.top(1) == ([(1040.0, 2)], [(1050.0, 3)])
+    _, snapshot, bids, asks = banded.changes_since(seq)
+    assert not snapshot
+    assert [1050.0, 3.0] in asks.tolist()
+
+
+@pytest.mark.parametrize('band', [None, 0.01])
+def test_partial_resets_book(band):
+    order_book_l2 = OrderBookL2(band=band, band_levels=1)
+    order_book_l2.message({'action': 'partial', 'data': [row(ID_BASE - 99, 'Buy', 1), row(ID_BASE - 100, 'Sell', 2),
+                                                         row(ID_BASE - 50, 'Buy', 3)]})
+    seq = order_book_l2.seq
+    # resubscription after a reconnect: the levels at 99 and 50 were cancelled during the outage.
+    order_book_l2.message({'action': 'partial', 'data': [row(ID_BASE - 98, 'Buy', 4), row(ID_BASE - 100, 'Sell', 2)]})
+    assert order_book_l2.bbo() == (98.0, 100.0)
+    assert order_book_l2.top(5) == ([(98.0, 4)], [(100.0, 2)])
+    assert not order_book_l2.far_levels
+    _, snapshot, bids, asks = order_book_l2.changes_since(seq)
+    assert snapshot
+    assert bids.tolist() == [[98.0, 4.0]]
+    assert asks.tolist() == [[100.0, 2.0]]
+
+
+def test_band_levels_for():
+    assert band_levels_for(30, None, 20) == 20  # unbanded: band_levels has no effect, nothing to check.
+    assert band_levels_for(30, None) is None
+    assert band_levels_for(5, 0.02) == BAND_LEVELS
+    assert band_levels_for(30, 0.02) == 30
+    assert band_levels_for(30, 0.02, 40) == 40
+    with pytest.raises(ValueError):
+        band_levels_for(30, 0.02, 20)
+    assert OrderBookL2(band=0.02).band_levels == BAND_LEVELS